@@ -1,25 +1,84 @@
 #!/usr/bin/env python3
-import re
+# google-re2 (線形時間 DFA) があれば正規表現エンジンとして使う。
+# 本スクリプトのパターンは後方参照・先読みを使わないため RE2 互換
+try:
+    import re2 as re
+except ImportError:
+    import re
+# bytes 走査用に stdlib の re も常に参照できるようにしておく（PREFIX_RE_B 参照）
+import re as _stdlib_re
 import sys
 import json
+import mmap
+import multiprocessing
 import os
-from datetime import datetime, timezone
+
+# orjson (C 実装) があれば JSON 出力に使う。stdlib json の 3〜10 倍高速
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# pandas があれば行ループを C レベルの一括処理に置き換える（convert_vectorized 参照）
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+# psutil があれば空きメモリ量に応じて逐次走査のチャンクサイズを適応させる
+try:
+    import psutil
+except ImportError:
+    psutil = None
 
 # グローバルリスト: ログレコードを蓄積する
+# メモリ節約のため dict ではなくタプル
+# (timestamp, type, group, name, value, comment) で保持し、
+# JSON 出力時にのみ dict 化する
 records = []
-# グローバル辞書: (group, name) ペアで、表示するものだけ true を設定する
-default_visibilities = {}
+# グローバル集合: default_visible 指定された (group, name) ペア。
+# 「登録済みか」だけ分かればよいので dict ではなく set で持つ
+_visible_seen = set()
+
+# 毎行の属性参照 (records.append) を避けるための束縛メソッド
+_records_append = records.append
+
+# 2025年1月1日以降のデータのみ処理するための基準日時。
+# ISO8601 タイムスタンプは辞書順がそのまま時刻順になるため、
+# datetime に変換せず文字列比較だけでフィルタできる
+CUTOFF_STR = "2025-01-01T00:00:00"
+
+# 全レコード共通の固定フィールド。intern 済み定数にして
+# dict 格納・比較時のハッシュ計算と重複文字列の保持を省く
+_TYPE_PULSE = sys.intern("PULSE")
+_DEFAULT_GROUP = sys.intern("group1")
+_DEFAULT_VALUE = 400
 
 def add_record(timestamp, type_val, group, name, value, comment):
     """
     各フィールドを受け取りレコードを生成し、records に追加する。
     また、コメントに "[default_visible]" が含まれていれば、
-    該当の (group, name) ペアを default_visibilities に true として登録する。
+    該当の (group, name) ペアを _visible_seen に登録する。
     """
     if not timestamp:
         return
 
-    record = {
+    _records_append((timestamp, type_val, group, name, value, comment))
+
+
+    # コメントに "[default_visible]" があれば、表示対象として登録。
+    # 既出ペアの再書き込みを避けるため、先に所属判定だけ行う
+    if comment and comment.find("[default_visible]") != -1:
+        key = (group, name)
+        if key not in _visible_seen:
+            _visible_seen.add(key)
+
+def _record_as_dict(rec):
+    """
+    タプル形式のレコードを JSON 出力用の dict に変換する。
+    """
+    timestamp, type_val, group, name, value, comment = rec
+    return {
         "timestamp": timestamp,
         "type": type_val,
         "group": group,
@@ -27,122 +86,325 @@ def add_record(timestamp, type_val, group, name, value, comment):
         "value": value,
         "comment": comment
     }
-    records.append(record)
-    
-    # コメントに "[default_visible]" があれば、表示対象として true を設定
-    if comment and "[default_visible]" in comment:
-        default_visibilities[(group, name)] = True
 
 def handle_pattern1(m, timestamp):
     # 1 番目のパターンの処理
-    name = m.group("name")
+    # name / group はユニーク数が少ないため intern して重複保持を避ける
+    name = sys.intern(m.group("name"))
     comment = m.group("comment")
-    # "hoge.c-100" のような形式の場合、'-' で分割して先頭部分をグループ名とする
-    group_match = re.match(r'^(?P<group>[^-]+\.c)', name)
-    if group_match:
-        group_val = group_match.group("group")
-    else:
-        group_val = "group1"
-    
+    # "hoge.c-100" のような形式の場合、先頭の "〜.c" 部分をグループ名とする
+    # （グループ抽出は PATTERN1 に畳み込み済みで、追加の正規表現実行は不要）
+    group = m.group("group")
+    group_val = sys.intern(group) if group else _DEFAULT_GROUP
+
     add_record(
         timestamp if timestamp is not None else "",
-        "PULSE",
+        _TYPE_PULSE,
         group_val,
         name,
-        400,
+        _DEFAULT_VALUE,
         comment
     )
 
 def handle_pattern2(m, timestamp):
     # 2 番目のパターンの処理（必要に応じて実装）
-    name = m.group("name")
+    name = sys.intern(m.group("name"))
     priority = m.group("priority")
     comment = m.group("comment")
     if "hoge.c" in name:
         add_record(
             timestamp if timestamp is not None else "",
-            "PULSE",
-            "group1",
+            _TYPE_PULSE,
+            _DEFAULT_GROUP,
             name,
-            400,
+            _DEFAULT_VALUE,
             comment
         )
 
+# パターン文字列は逐次版 (re.compile) とベクトル化版 (pandas str.extract) で共有する
+PREFIX_PATTERN = (
+    r'(?:\[\d{2}:\d{2}:\d{2}\.\d+\]\s*)?'
+    r'(?P<ts>\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d+Z):[^:]+:[^:]+:\s*(?P<rest>.*)$'
+)
+# name の先頭が "〜.c" ならそれをグループ名として同時にキャプチャする。
+# 先頭の選択肢から試されるため、group が取れるのは従来の個別抽出と同じ場合のみ
+PATTERN1 = r'\[.*?\]\s+(?P<name>(?P<group>[^-:]+\.c)[^:]*|[^:]+):\s+(?P<comment>.+)$'
+
+# 逐次版は mmap したバッファをバイト列のまま MULTILINE で走査する。
+# バッファ全体に適用するため、\s / . のような改行を跨ぎ得る要素は
+# [ \t] / [^\n] に置き換えて 1 行の範囲に閉じ込めている。
+# この bytes パターンだけは stdlib re で固定する: re2 ラッパーは
+# MULTILINE 等のフラグ定数を持たず、bytes パターンのグループ名も
+# bytes でしか参照できないため
+# CRLF 改行のログでは \r を行末扱いにし、rest（ひいては comment）に混入させない
+PREFIX_RE_B = _stdlib_re.compile(
+    rb'^(?:\[\d{2}:\d{2}:\d{2}\.\d+\][ \t]*)?'
+    rb'(?P<ts>\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d+Z):[^:\r\n]+:[^:\r\n]+:[ \t]*(?P<rest>[^\r\n]*)\r?$',
+    _stdlib_re.MULTILINE
+)
+# bytes 同士の比較は str より速い
+CUTOFF_BYTES = CUTOFF_STR.encode("ascii")
+
+# パターンとハンドラの対応表。毎行リストを作り直さないようモジュールスコープで一度だけ構築する。
+# 各要素は [パターン, ハンドラ, ヒット数]。ヒット数は複数ハンドラ時の並べ替えに使う
+PATTERN_HANDLERS = [
+    [re.compile(PATTERN1), handle_pattern1, 0],
+    # [re.compile(r'\[(?P<priority>.+)\]\s+(?P<name>[^:]+):\s+(?P<comment>.+)$'), handle_pattern2, 0],
+]
+
+# この行数を処理した時点のヒット分布で PATTERN_HANDLERS を最頻順に並べ替える
+_REORDER_INTERVAL = 10000
+_lines_seen = 0
+
 def process_line_sub(line, timestamp=None):
     """
-    複数の正規表現を試し、合致した場合は add_record を呼び出す
+    複数の正規表現を試し、合致した場合は add_record を呼び出す。
+    実ログでは特定のパターンにヒットが集中するため、最初の
+    _REORDER_INTERVAL 行のヒット数で表を最頻順に並べ替え、
+    以降の行で外れパターンの試行回数を減らす
     """
-    pattern_handlers = [
-        (re.compile(r'^\[.*?\]\s+(?P<name>[^:]+):\s+(?P<comment>.+)$'), handle_pattern1),
-        # (re.compile(r'^\[(?P<priority>.+)\]\s+(?P<name>[^:]+):\s+(?P<comment>.+)$'), handle_pattern2),
-    ]
-
-    for pat, handler in pattern_handlers:
-        m = pat.search(line)
+    if len(PATTERN_HANDLERS) == 1:
+        # ハンドラが 1 つだけの間はループもカウントも不要
+        pat, handler, _ = PATTERN_HANDLERS[0]
+        m = pat.match(line)
         if m:
             handler(m, timestamp)
+        return
+
+    global _lines_seen
+    _lines_seen += 1
+    for entry in PATTERN_HANDLERS:
+        m = entry[0].match(line)
+        if m:
+            entry[2] += 1
+            entry[1](m, timestamp)
             # 複数パターンにヒットする可能性があるため、ループは継続
 
+    if _lines_seen == _REORDER_INTERVAL:
+        PATTERN_HANDLERS.sort(key=lambda entry: entry[2], reverse=True)
+
+def convert_vectorized(input_file):
+    """
+    pandas による一括変換。行ごとの Python ループを使わず、
+    str.extract（C 実装）でプレフィックス抽出・カットオフ・ハンドラ抽出を
+    列単位で一気に処理する。結果は逐次版と同じく records /
+    _visible_seen に蓄積される。
+    """
+    with open(input_file, 'r', encoding='utf-8') as f:
+        s = pd.Series(f.read().splitlines(), dtype="object")
+
+    # プレフィックス抽出（str.extract は search 相当なので ^ を付けて行頭に固定する）
+    df = s.str.extract('^' + PREFIX_PATTERN)
+    df = df.dropna(subset=["ts"])
+    # ISO8601 は辞書順 = 時刻順なので文字列比較でフィルタできる
+    df = df[df["ts"] >= CUTOFF_STR]
+
+    # ハンドラ 1 のパターンを残り部分へ適用（group も同じ 1 パスで得られる）
+    sub = df["rest"].str.extract('^' + PATTERN1)
+    sub["ts"] = df["ts"]
+    sub = sub.dropna(subset=["name"])
+
+    groups = sub["group"].fillna(_DEFAULT_GROUP)
+
+    for ts, name, comment, group in zip(sub["ts"], sub["name"], sub["comment"], groups):
+        add_record(ts, _TYPE_PULSE, sys.intern(group), sys.intern(name),
+                   _DEFAULT_VALUE, comment)
+
+def _scan_buffer(buf, start, end):
+    """
+    バッファの [start, end) 区間を走査し、ISO8601 プレフィックスを持つ行を
+    records に蓄積する。finditer がマッチ行だけを C レベルで拾うため、
+    行ごとの Python str 生成はキャプチャグループ分に限られる。
+    """
+    # ホットループ内のグローバル参照・属性参照をローカル変数に束縛する
+    # （LOAD_GLOBAL / LOAD_ATTR は LOAD_FAST より数倍遅く、行数分積み重なる）
+    process = process_line_sub
+    cutoff = CUTOFF_BYTES
+
+    for m in PREFIX_RE_B.finditer(buf, start, end):
+        ts = m.group("ts")
+        # 指定日時より前のデータはスキップ（datetime を構築せず bytes 比較のみ）
+        if ts < cutoff:
+            continue
+        process(m.group("rest").decode("utf-8"), ts.decode("ascii"))
+
+# 1 チャンクで走査するバイト数の下限・上限と、空きメモリのうち充ててよい割合
+_CHUNK_MIN_BYTES = 4 * 1024 * 1024
+_CHUNK_MAX_BYTES = 256 * 1024 * 1024
+_CHUNK_MEM_FRACTION = 0.25
+
+def _adaptive_chunk_size():
+    """
+    次チャンクのサイズを決める。psutil があれば空きメモリから
+    clamp(M_avail * 割合, 下限, 上限) で算出し、メモリが細る環境では
+    自動的にチャンクを小さくする。psutil がなければ上限固定。
+    """
+    if psutil is None:
+        return _CHUNK_MAX_BYTES
+    avail = psutil.virtual_memory().available
+    return max(_CHUNK_MIN_BYTES, min(int(avail * _CHUNK_MEM_FRACTION), _CHUNK_MAX_BYTES))
+
+def convert_sequential(input_file, writer):
+    """
+    ファイルを mmap してバイト列のまま逐次走査する変換
+    （pandas 非依存のフォールバック）。ページキャッシュを直接参照するため、
+    行ごとの Python str オブジェクトを生成しない。
+
+    走査は改行境界に揃えたチャンク単位で行い、チャンクごとに records を
+    writer へ書き出して解放する。チャンクサイズは毎回空きメモリから
+    決め直すため、ピークメモリは入力サイズによらず有界になる。
+
+    ISO8601 プレフィックスを持たない行は add_record が空タイムスタンプを
+    拒否するためレコードを生成し得ず、走査対象から外しても出力は変わらない。
+    """
+    size = os.path.getsize(input_file)
+    if size == 0:
+        return
+    with open(input_file, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            pos = 0
+            while pos < size:
+                end = min(pos + _adaptive_chunk_size(), size)
+                if end < size:
+                    nl = mm.find(b'\n', end)
+                    end = size if nl == -1 else nl + 1
+                _scan_buffer(mm, pos, end)
+                writer.write_records(records)
+                records.clear()
+                pos = end
+        finally:
+            mm.close()
+
+class RecordWriter:
+    """
+    logs 配列を 1 レコードずつ直列化して書き出すストリーミング JSON ライタ。
+    write_records を繰り返し呼べるため、チャンク処理と組み合わせて
+    records を都度 drain しながら出力できる。close() 時に
+    default_visibility（_visible_seen の内容）を書いて JSON を閉じる。
+    """
+
+    def __init__(self, output_file):
+        if orjson is not None:
+            self._dumps = orjson.dumps
+        else:
+            self._dumps = lambda obj: json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self._f = open(output_file, 'wb')
+        self._f.write(b'{"logs":[\n')
+        self._first = True
+
+    def write_records(self, recs):
+        f = self._f
+        dumps = self._dumps
+        for rec in recs:
+            if not self._first:
+                f.write(b',\n')
+            f.write(dumps(_record_as_dict(rec)))
+            self._first = False
+
+    def close(self):
+        self._f.write(b'\n],"default_visibility":')
+        # _visible_seen がそのまま表示対象の集合。出力順を安定させるためソートする
+        self._f.write(self._dumps([
+            {"group": group, "name": name, "visible": True}
+            for group, name in sorted(_visible_seen)
+        ]))
+        self._f.write(b'}\n')
+        self._f.close()
+
+# これより小さいファイルはワーカープロセスの起動コストの方が高くつく
+_PARALLEL_MIN_BYTES = 64 * 1024 * 1024
+
+def _chunk_ranges(input_file, n_chunks):
+    """
+    ファイルを改行境界に揃えた n_chunks 個以下の [start, end) 区間に分割する。
+    境界は等分点から次の改行まで前進させるため、行がチャンクを跨ぐことはない。
+    """
+    size = os.path.getsize(input_file)
+    with open(input_file, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            bounds = [0]
+            for i in range(1, n_chunks):
+                pos = max(size * i // n_chunks, bounds[-1])
+                nl = mm.find(b'\n', pos)
+                bounds.append(size if nl == -1 else nl + 1)
+            bounds.append(size)
+        finally:
+            mm.close()
+    return [(s, e) for s, e in zip(bounds, bounds[1:]) if s < e]
+
+def _process_chunk(args):
+    """
+    ワーカープロセス側: 担当区間を走査し、蓄積したレコードと
+    default_visible な (group, name) キーを親プロセスへ返す。
+    """
+    input_file, start, end = args
+    # fork で親の蓄積領域を引き継いでいる可能性があるため、必ず空にしてから使う
+    records.clear()
+    _visible_seen.clear()
+    with open(input_file, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            _scan_buffer(mm, start, end)
+        finally:
+            mm.close()
+    return records[:], list(_visible_seen)
+
+def convert_parallel(input_file, n_workers, writer):
+    """
+    ファイルをチャンク分割して multiprocessing.Pool で並列変換する。
+    行処理は互いに独立なので、チャンク順に結果を書き出せば
+    逐次版と同一の出力になる。各チャンクの結果は受け取り次第 writer へ
+    流して捨てるため、親プロセスに全レコードが滞留しない。
+    コンパイル済みパターンはモジュールスコープにあるため、
+    fork 時にそのままワーカーへ引き継がれる。
+
+    チャンク数はワーカー数ではなく適応チャンクサイズから決める。
+    ワーカー数で等分すると 1 ワーカーあたり size/n の範囲を丸ごと蓄積・
+    pickle 返送することになり、巨大ファイルでは逐次版のメモリ上界が
+    並列パスにだけ存在しない状態になるため
+    """
+    size = os.path.getsize(input_file)
+    n_chunks = max(n_workers, size // _adaptive_chunk_size() + 1)
+    ranges = _chunk_ranges(input_file, n_chunks)
+    with multiprocessing.Pool(n_workers) as pool:
+        # imap は投入順に結果を返すため、出力順が保たれる
+        for chunk_records, visible_keys in pool.imap(
+                _process_chunk, [(input_file, s, e) for s, e in ranges]):
+            writer.write_records(chunk_records)
+            _visible_seen.update(visible_keys)
+
 def main():
     if len(sys.argv) != 2:
         print("Usage: python convert.py input.log")
         sys.exit(1)
-    
-    input_file = sys.argv[1]
-    
-    # ファイル全行を読み込み
-    with open(input_file, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
 
-    # 角括弧タイムスタンプ（例: [05:30:56.917948]）の除去用正規表現
-    bracket_ts_re = re.compile(r'^\[\d{2}:\d{2}:\d{2}\.\d+\]\s*')
-    # ISO8601 タイムスタンプをキャプチャする正規表現
-    prefix_re = re.compile(
-        r'^(?P<ts>\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d+Z):[^:]+:[^:]+:\s*(?P<rest>.*)$'
-    )
-    # 2025年1月1日以降のデータのみ処理するための基準日時
-    cutoff_date = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    input_file = sys.argv[1]
+    size = os.path.getsize(input_file)
+    n_workers = os.cpu_count() or 1
 
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-        
-        # 角括弧タイムスタンプの除去
-        line = bracket_ts_re.sub("", line)
-        
-        m = prefix_re.match(line)
-        if m:
-            ts_extracted = m.group("ts")
-            try:
-                dt = datetime.fromisoformat(ts_extracted.replace("Z", "+00:00"))
-                if dt.tzinfo is None:
-                    dt = dt.replace(tzinfo=timezone.utc)
-            except ValueError:
-                print(f"Warning: Unable to parse timestamp: {ts_extracted}", file=sys.stderr)
-                continue
-
-            # 指定日時より前のデータはスキップ
-            if dt < cutoff_date:
-                continue
-
-            rest = m.group("rest")
-            process_line_sub(rest, ts_extracted)
-        else:
-            process_line_sub(line)
-    
     output_file = os.path.splitext(input_file)[0] + ".json"
-    output = {
-        "logs": records,
-        # default_visibility では、true として登録されたものだけ出力する
-        "default_visibility": [
-            {"group": key[0], "name": key[1], "visible": True}
-            for key, value in default_visibilities.items() if value
-        ]
-    }
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(output, f, indent=2)
-    
+    writer = RecordWriter(output_file)
+
+    # 巨大ファイルはチャンク並列（マルチコア時）か逐次版で処理する。
+    # ベクトル化版は全行と DataFrame を一括でメモリに載せるため、
+    # コア数によらず小さいファイルにしか使わない。それ以外で pandas があり、
+    # かつハンドラ表がベクトル化版の再現対象（パターン 1 のみ）の場合は
+    # 一括変換を、どちらでもなければ逐次版を使う。
+    # ハンドラを追加した場合は自動で逐次版に戻る
+    if n_workers > 1 and size >= _PARALLEL_MIN_BYTES:
+        convert_parallel(input_file, n_workers, writer)
+    elif (size < _PARALLEL_MIN_BYTES and pd is not None
+            and len(PATTERN_HANDLERS) == 1
+            and PATTERN_HANDLERS[0][1] is handle_pattern1):
+        convert_vectorized(input_file)
+        writer.write_records(records)
+    else:
+        convert_sequential(input_file, writer)
+
+    writer.close()
+
     print(f"Converted {input_file} to {output_file}")
 
 if __name__ == '__main__':